@@ -1,4 +1,4 @@
-import imp, string, sys, os.path, __builtin__
+import imp, sys, os.path, __builtin__
 from griffin import uname, arch, soext, sopre, platspec, pyspec, vpath
 
 
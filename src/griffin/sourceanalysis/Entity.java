@@ -258,6 +258,16 @@ public abstract class Entity {
 	{
 		m_affiliates.add(friend);
 	}
+
+	/**
+	 * Sets the entire list of affiliates at once. Any existing affiliates
+	 * are replaced by the new setting.
+	 * @param friends the connections declaring this Entity as a friend
+	 */
+	protected void setAffiliates(Collection<FriendConnection> friends)
+	{
+		m_affiliates = new LinkedList<FriendConnection>(friends);
+	}
 	/*@}*/
 	
 	/** @name Pull API
@@ -34,16 +34,43 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import os as _os
 import re as _re
 import sys as _sys
-import textwrap as _textwrap
 
-from gettext import gettext as _
-
-SUPPRESS = '==SUPPRESS=='
-
-OPTIONAL = '?'
-ZERO_OR_MORE = '*'
-ONE_OR_MORE = '+'
-PARSER = '==PARSER=='
+# the sentinels are interned so that they can be compared with 'is'; see
+# also Action.__init__, which interns string nargs
+SUPPRESS = intern('==SUPPRESS==')
+
+OPTIONAL = intern('?')
+ZERO_OR_MORE = intern('*')
+ONE_OR_MORE = intern('+')
+PARSER = intern('==PARSER==')
+
+_LONG_BREAK_RE = _re.compile(r'\n\n\n+')
+_OPTION_MARK_RE = _re.compile('O')
+
+# usage formats for the symbolic nargs values; integer nargs simply
+# repeat the metavar
+_NARGS_FORMATTERS = {
+    None: lambda name: name,
+    OPTIONAL: lambda name: '[%s]' % name,
+    ZERO_OR_MORE: lambda name: '[%s [%s ...]]' % (name, name),
+    ONE_OR_MORE: lambda name: '%s [%s ...]' % (name, name),
+    PARSER: lambda name: '%s ...' % name,
+}
+
+# argument patterns for each nargs value; '--' args appear as '-' and
+# are allowed anywhere. Patterns for integer nargs are added on first use
+_NARGS_PATTERNS = {
+    # the default (None) is assumed to be a single argument
+    None: '(-*A-*)',
+    # allow zero or one arguments
+    OPTIONAL: '(-*A?-*)',
+    # allow zero or more arguments
+    ZERO_OR_MORE: '(-*[A-]*)',
+    # allow one or more arguments
+    ONE_OR_MORE: '(-*A[A-]*)',
+    # allow one argument followed by any number of options or arguments
+    PARSER: '(-*A[-AO]*)',
+}
 
 # =============================
 # Utility functions and classes
@@ -73,6 +100,24 @@ class _AttributeHolder(object):
     def _get_args(self):
         return []
 
+def _(message):
+    # import gettext only when the first message is translated; this
+    # function then replaces itself with gettext.gettext
+    global _
+    from gettext import gettext as _
+    return _(message)
+
+_nargs_regex_cache = {}
+
+def _compile_nargs_pattern(pattern):
+    # nargs patterns are built from a handful of pieces, so keep every
+    # compiled one for the next match or the next parse
+    try:
+        return _nargs_regex_cache[pattern]
+    except KeyError:
+        regex = _nargs_regex_cache[pattern] = _re.compile(pattern)
+        return regex
+
 def _ensure_value(namespace, name, value):
     if getattr(namespace, name, None) is None:
         setattr(namespace, name, value)
@@ -112,7 +157,9 @@ class HelpFormatter(object):
         self._root_section = self._Section(self, None)
         self._current_section = self._root_section
 
-        self._long_break_matcher = _re.compile(r'\n\n\n+')
+        self._wrappers = {}
+        self._invocation_cache = {}
+        self._choices_cache = {}
 
     # ===============================
     # Section and indentation methods
@@ -128,6 +175,9 @@ class HelpFormatter(object):
         self._level -= 1
 
     class _Section(object):
+
+        __slots__ = ('formatter', 'parent', 'heading', 'items')
+
         def __init__(self, formatter, parent, heading=None):
             self.formatter = formatter
             self.parent = parent
@@ -139,8 +189,6 @@ class HelpFormatter(object):
             if self.parent is not None:
                 self.formatter._indent()
             join = self.formatter._join_parts
-            for func, args in self.items:
-                func(*args)
             item_help = join(func(*args) for func, args in self.items)
             if self.parent is not None:
                 self.formatter._dedent()
@@ -188,8 +236,10 @@ class HelpFormatter(object):
     def add_argument(self, action):
         if action.help is not SUPPRESS:
             
-            # update the maximum item length
+            # update the maximum item length, keeping the invocation
+            # around for _format_action
             invocation = self._format_action_invocation(action)
+            self._invocation_cache[id(action)] = invocation
             action_length = len(invocation) + self._current_indent
             self._action_max_length = max(self._action_max_length,
                                           action_length)
@@ -208,14 +258,27 @@ class HelpFormatter(object):
     def format_help(self):
         help = self._root_section.format_help() % dict(prog=self._prog)
         if help:
-            help = self._long_break_matcher.sub('\n\n', help)
+            help = _LONG_BREAK_RE.sub('\n\n', help)
             help = help.strip('\n') + '\n'
         return help
 
     def _join_parts(self, part_strings):
-        return ''.join(part
-                       for part in part_strings
-                       if part and part is not SUPPRESS)
+        return ''.join([part
+                        for part in part_strings
+                        if part and part is not SUPPRESS])
+
+    def _get_wrapper(self, width, initial_indent='', subsequent_indent=''):
+        # reuse one TextWrapper per width instead of building a new one
+        # (as textwrap.fill and textwrap.wrap do) for every paragraph
+        try:
+            wrapper = self._wrappers[width]
+        except KeyError:
+            import textwrap as _textwrap
+            wrapper = _textwrap.TextWrapper(width)
+            self._wrappers[width] = wrapper
+        wrapper.initial_indent = initial_indent
+        wrapper.subsequent_indent = subsequent_indent
+        return wrapper
 
     def _format_usage(self, usage, optionals, positionals, prefix):
         if prefix is None:
@@ -234,6 +297,13 @@ class HelpFormatter(object):
             prefix_indent = self._current_indent + prefix_width
             text_width = self._width - self._current_indent
 
+            # drop suppressed actions once, rather than in each of the
+            # (up to three) calls to _format_actions_usage below
+            optionals = [action for action in optionals
+                         if action.help is not SUPPRESS]
+            positionals = [action for action in positionals
+                           if action.help is not SUPPRESS]
+
             # put them on one line if they're short enough
             format = self._format_actions_usage
             action_usage = format(optionals + positionals)
@@ -245,24 +315,19 @@ class HelpFormatter(object):
                 optional_usage = format(optionals)
                 positional_usage = format(positionals)
                 indent = ' ' * prefix_indent
+                wrapper = self._get_wrapper(text_width, indent, indent)
 
                 # usage is made of PROG, optionals and positionals
                 parts = [usage, ' ']
                 
                 # options always get added right after PROG
                 if optional_usage:
-                    parts.append(_textwrap.fill(
-                        optional_usage, text_width,
-                        initial_indent=indent,
-                        subsequent_indent=indent).lstrip())
+                    parts.append(wrapper.fill(optional_usage).lstrip())
 
                 # if there were options, put arguments on the next line
                 # otherwise, start them right after PROG
                 if positional_usage:
-                    part = _textwrap.fill(
-                        positional_usage, text_width,
-                        initial_indent=indent,
-                        subsequent_indent=indent).lstrip()
+                    part = wrapper.fill(positional_usage).lstrip()
                     if optional_usage:
                         part = '\n' + indent + part
                     parts.append(part)
@@ -272,14 +337,14 @@ class HelpFormatter(object):
         return '%s%s\n\n' % (prefix, usage)
 
     def _format_actions_usage(self, actions):
+        # bind the per-action helpers once, outside the loop
+        format_args = self._format_args
         parts = []
+        append = parts.append
         for action in actions:
-            if action.help is SUPPRESS:
-                continue
-
             # produce all arg strings        
             if not action.option_strings:
-                parts.append(self._format_args(action, action.dest))
+                append(format_args(action, action.dest))
 
             # produce the first way to invoke the option in brackets
             else:
@@ -288,14 +353,14 @@ class HelpFormatter(object):
                 # if the Optional doesn't take a value, format is:
                 #    -s or --long
                 if action.nargs == 0:
-                    parts.append('[%s]' % option_string)
+                    append('[%s]' % option_string)
 
                 # if the Optional takes a value, format is:
                 #    -s ARGS or --long ARGS
                 else:
                     default = action.dest.upper()
-                    args_string = self._format_args(action, default)
-                    parts.append('[%s %s]' % (option_string, args_string))
+                    args_string = format_args(action, default)
+                    append('[%s %s]' % (option_string, args_string))
 
         return ' '.join(parts)
 
@@ -303,52 +368,60 @@ class HelpFormatter(object):
     def _format_text(self, text):
         text_width = self._width - self._current_indent
         indent = ' ' * self._current_indent
-        return _textwrap.fill(text, text_width,
-                              initial_indent=indent,
-                              subsequent_indent=indent) + '\n\n'
+        wrapper = self._get_wrapper(text_width, indent, indent)
+        return wrapper.fill(text) + '\n\n'
 
     def _format_action(self, action):
+        current_indent = self._current_indent
+
         # determine the required width and the entry label
         help_position = min(self._action_max_length + 2,
                             self._max_help_position)
         help_width = self._width - help_position
-        action_width = help_position - self._current_indent - 2
-        action_header = self._format_action_invocation(action)
+        action_width = help_position - current_indent - 2
+        try:
+            action_header = self._invocation_cache[id(action)]
+        except KeyError:
+            action_header = self._format_action_invocation(action)
+
+        # build the indentation strings once, instead of using %*s
+        indent_str = ' ' * current_indent
+        help_indent_str = ' ' * help_position
 
         # ho nelp; start on same line and add a final newline
         if not action.help:
-            tup = self._current_indent, '', action_header
-            action_header = '%*s%s\n' % tup
+            action_header = indent_str + action_header + '\n'
             
         # short action name; start on the same line and pad two spaces
         elif len(action_header) <= action_width:
-            tup = self._current_indent, '', action_width, action_header
-            action_header = '%*s%-*s  ' % tup
-            indent_first = 0
+            action_header = indent_str + action_header.ljust(action_width)
+            action_header += '  '
+            indent_first = ''
 
         # long action name; start on the next line
         else:
-            tup = self._current_indent, '', action_header
-            action_header = '%*s%s\n' % tup
-            indent_first = help_position
-
-        # collect the pieces of the action help
-        parts = [action_header]
+            action_header = indent_str + action_header + '\n'
+            indent_first = help_indent_str
 
         # if there was help for the action, add lines of help text
         if action.help:
             help_text = self._expand_help(action)
-            help_lines = _textwrap.wrap(help_text, help_width)
-            parts.append('%*s%s\n' % (indent_first, '', help_lines[0]))
-            for line in help_lines[1:]:
-                parts.append('%*s%s\n' % (help_position, '', line))
+            help_lines = self._get_wrapper(help_width).wrap(help_text)
+            parts = [help_indent_str + line + '\n' for line in help_lines]
+
+            # the first line goes right after the header instead
+            parts[0] = action_header + indent_first + help_lines[0] + '\n'
 
         # or add a newline if the description doesn't end with one
         elif not action_header.endswith('\n'):
-            parts.append('\n')
+            parts = [action_header, '\n']
+
+        else:
+            parts = [action_header]
 
-        # return a single string            
-        return self._join_parts(parts)
+        # return a single string; every part is a non-empty line here,
+        # so there is nothing for _join_parts to filter
+        return ''.join(parts)
 
     def _format_action_invocation(self, action):
         if not action.option_strings:
@@ -367,8 +440,8 @@ class HelpFormatter(object):
             else:
                 default = action.dest.upper()
                 args_string = self._format_args(action, default)
-                for option_string in action.option_strings:
-                    parts.append('%s %s' % (option_string, args_string))
+                parts = ['%s %s' % (option_string, args_string)
+                         for option_string in action.option_strings]
 
             return ', '.join(parts)
 
@@ -376,37 +449,42 @@ class HelpFormatter(object):
         if action.metavar is not None:
             name = action.metavar
         elif action.choices is not None:
-            choice_strs = (str(choice) for choice in action.choices)
-            name = '{%s}' % ','.join(choice_strs)
+            name = self._choices_metavar(action)
         else:
             name = default_metavar
         return name
 
+    def _choices_metavar(self, action):
+        # the {a,b,c} string is needed once per option string and once for
+        # the usage, so build it only the first time in each rendering
+        try:
+            return self._choices_cache[id(action)]
+        except KeyError:
+            choices_str = '{%s}' % ','.join(map(str, action.choices))
+            self._choices_cache[id(action)] = choices_str
+            return choices_str
+
     def _format_args(self, action, default_metavar):
         name = self._format_metavar(action, default_metavar)
-        if action.nargs is None:
-            result = name
-        elif action.nargs == OPTIONAL:
-            result = '[%s]' % name
-        elif action.nargs == ZERO_OR_MORE:
-            result = '[%s [%s ...]]' % (name, name)
-        elif action.nargs == ONE_OR_MORE:
-            result = '%s [%s ...]' % (name, name)
-        elif action.nargs is PARSER:
-            result = '%s ...' % name
-        else:
-            result = ' '.join([name] * action.nargs)
-        return result
+        formatter = _NARGS_FORMATTERS.get(action.nargs)
+        if formatter is None:
+            return ' '.join([name] * action.nargs)
+        return formatter(name)
 
     def _expand_help(self, action):
-        params = dict(vars(action), prog=self._prog)
-        for name, value in params.items():
-            if value is SUPPRESS:
-                del params[name]
+        # most help strings have no %(name)s specifiers to fill in
+        help_str = action.help
+        if '%' not in help_str:
+            return help_str
+
+        params = dict([(name, value)
+                       for name, value in vars(action).items()
+                       if value is not SUPPRESS])
+        params['prog'] = self._prog
         if params.get('choices') is not None:
             choices_str = ', '.join(str(c) for c in params['choices'])
             params['choices'] = choices_str
-        return action.help % params
+        return help_str % params
 
 
 # =====================
@@ -505,6 +583,8 @@ class Action(_AttributeHolder):
                  metavar=None):
         self.option_strings = option_strings
         self.dest = dest
+        if isinstance(nargs, basestring):
+            nargs = intern(str(nargs))
         self.nargs = nargs
         self.const = const
         self.default = default
@@ -701,7 +781,6 @@ class VersionAction(Action):
         parser.exit()
         
 class SubParsersAction(Action):
-
     def __init__(self,
                  option_strings,
                  prog,
@@ -757,16 +836,32 @@ class SubParsersAction(Action):
 class Namespace(_AttributeHolder):
 
     def __init__(self, **kwargs):
-        for name, value in kwargs.iteritems():
-            setattr(self, name, value)
+        self.__dict__.update(kwargs)
 
     def __eq__(self, other):
-        return vars(self) == vars(other)
+        return self.__dict__ == other.__dict__
 
     def __ne__(self, other):
         return not (self == other)
 
 
+# the actions every container starts out with; each container gets its
+# own copy, so register() on one container does not affect the others
+_DEFAULT_ACTION_REGISTRY = {
+    None: StoreAction,
+    'store': StoreAction,
+    'store_const': StoreConstAction,
+    'store_true': StoreTrueAction,
+    'store_false': StoreFalseAction,
+    'append': AppendAction,
+    'append_const': AppendConstAction,
+    'count': CountAction,
+    'help': HelpAction,
+    'version': VersionAction,
+    'parsers': SubParsersAction,
+}
+
+
 class _ActionsContainer(object):
     def __init__(self,
                  description,
@@ -777,21 +872,8 @@ class _ActionsContainer(object):
         self.description = description
         self.conflict_handler = conflict_handler
 
-        # set up registries
-        self._registries = {}
-
-        # register actions
-        self.register('action', None, StoreAction)
-        self.register('action', 'store', StoreAction)
-        self.register('action', 'store_const', StoreConstAction)
-        self.register('action', 'store_true', StoreTrueAction)
-        self.register('action', 'store_false', StoreFalseAction)
-        self.register('action', 'append', AppendAction)
-        self.register('action', 'append_const', AppendConstAction)
-        self.register('action', 'count', CountAction)
-        self.register('action', 'help', HelpAction)
-        self.register('action', 'version', VersionAction)
-        self.register('action', 'parsers', SubParsersAction)
+        # set up registries, starting with the default actions
+        self._registries = {'action': dict(_DEFAULT_ACTION_REGISTRY)}
         
         # raise an exception if the conflict handler is invalid
         self._get_handler()
@@ -802,6 +884,15 @@ class _ActionsContainer(object):
         self._short_option_strings = {}
         self._long_option_strings = {}
 
+        # lookup structures derived from the actions, built on demand
+        self._long_option_trie = None
+        self._all_optionals = None
+        self._default_actions = None
+        self._type_funcs = {}
+
+        # set by ArgumentParser.freeze()
+        self._frozen = False
+
     # ====================
     # Registration methods
     # ====================
@@ -809,6 +900,7 @@ class _ActionsContainer(object):
     def register(self, registry_name, value, object):
         registry = self._registries.setdefault(registry_name, {})
         registry[value] = object
+        self._actions_changed()
 
     def _registry_get(self, registry_name, value, default=None):
         return self._registries[registry_name].get(value, default)
@@ -832,13 +924,20 @@ class _ActionsContainer(object):
         # otherwise, we're adding an optional argument
         else:
             kwargs = self._get_optional_kwargs(*args, **kwargs)
+
+        # the option strings were already split into short and long while
+        # they were validated; that is not an argument to the action
+        split_option_strings = (kwargs.pop('_short_option_strings', []),
+                                kwargs.pop('_long_option_strings', []))
             
         # create the action object, and add it to the parser
         action_class = self._pop_action_class(kwargs)
         action = action_class(**kwargs)
-        return self._add_action(action)
+        return self._add_action(action, split_option_strings)
+
+    def _add_action(self, action, split_option_strings=None):
+        self._check_not_frozen()
 
-    def _add_action(self, action):
         # resolve any conflicts
         self._check_conflict(action)
 
@@ -850,20 +949,69 @@ class _ActionsContainer(object):
         action.container = self
 
         # index the action by any option strings it has
-        for option_string in action.option_strings:
-            if option_string.startswith('--'):
-                self._long_option_strings[option_string] = action
-            else:
-                self._short_option_strings[option_string] = action
+        if split_option_strings is None:
+            split_option_strings = self._split_option_strings(
+                action.option_strings)
+        short_option_strings, long_option_strings = split_option_strings
+        if short_option_strings:
+            self._short_option_strings.update(
+                dict.fromkeys(short_option_strings, action))
+        if long_option_strings:
+            self._long_option_strings.update(
+                dict.fromkeys(long_option_strings, action))
+        self._actions_changed()
 
         # return the created action
         return action
 
+    def _actions_changed(self):
+        # forget everything derived from the registered actions and the
+        # registries
+        self._long_option_trie = None
+        self._all_optionals = None
+        self._default_actions = None
+        self._type_funcs = {}
+
+    def _check_not_frozen(self):
+        if self._frozen:
+            raise ValueError(_('cannot add arguments to a frozen parser'))
+
     def _add_container_actions(self, container):
-        for action in container._optional_actions_list:
-            self._add_action(action)
-        for action in container._positional_actions_list:
-            self._add_action(action)
+        self._check_not_frozen()
+        optionals = container._optional_actions_list
+        positionals = container._positional_actions_list
+
+        # map each option string to be added to its action
+        option_string_actions = {}
+        for action in optionals:
+            for option_string in action.option_strings:
+                option_string_actions[option_string] = action
+
+        # if any option string conflicts, add the actions one at a time
+        # so that the conflict handler sees them in order
+        short_opts = self._short_option_strings
+        long_opts = self._long_option_strings
+        for option_string in option_string_actions:
+            if option_string in short_opts or option_string in long_opts:
+                for action in optionals:
+                    self._add_action(action)
+                for action in positionals:
+                    self._add_action(action)
+                return
+
+        # otherwise add them in bulk
+        for action in optionals:
+            action.container = self
+        for action in positionals:
+            action.container = self
+        self._optional_actions_list.extend(optionals)
+        self._positional_actions_list.extend(positionals)
+        for option_string, action in option_string_actions.iteritems():
+            if option_string.startswith('--'):
+                long_opts[option_string] = action
+            else:
+                short_opts[option_string] = action
+        self._actions_changed()
 
     def _get_positional_kwargs(self, dest, **kwargs):
         # all necessary parsing is done by the signature above
@@ -872,7 +1020,11 @@ class _ActionsContainer(object):
 
     def _get_optional_kwargs(self, *args, **kwargs):
         # determine short and long option strings
-        option_strings = list(args)
+        # the option strings key the option string tables for the life
+        # of the parser, so intern them
+        option_strings = [isinstance(option_string, str) and
+                          intern(option_string) or option_string
+                          for option_string in args]
         short_option_strings = []
         long_option_strings = []
         for option_string in option_strings:
@@ -906,12 +1058,24 @@ class _ActionsContainer(object):
             else:
                 dest = short_option_strings[0][1:]
 
-        # return the updated keyword arguments
-        return dict(kwargs, dest=dest, option_strings=option_strings)
+        # return the updated keyword arguments, and the split option
+        # strings for add_argument
+        return dict(kwargs,
+                    dest=dest,
+                    option_strings=option_strings,
+                    _short_option_strings=short_option_strings,
+                    _long_option_strings=long_option_strings)
 
     def _split_option_strings(self, option_strings):
         # return the option strings, split into short and long
-        return short_option_strings, long_option_strings                
+        short_option_strings = []
+        long_option_strings = []
+        for option_string in option_strings:
+            if option_string.startswith('--'):
+                long_option_strings.append(option_string)
+            else:
+                short_option_strings.append(option_string)
+        return short_option_strings, long_option_strings
 
     def _pop_action_class(self, kwargs, default=None):
         action = kwargs.pop('action', default)
@@ -964,6 +1128,7 @@ class _ActionsContainer(object):
             # container holding it
             if not action.option_strings:
                 action.container._optional_actions_list.remove(action)
+        self._actions_changed()
 
 
 class ArgumentGroup(_ActionsContainer):
@@ -976,10 +1141,18 @@ class ArgumentGroup(_ActionsContainer):
         superinit(description=description, **kwargs)
         
         self.title = title
+        self._container = container
         self._registries = container._registries
         self._short_option_strings = container._short_option_strings
         self._long_option_strings = container._long_option_strings
 
+    def _actions_changed(self):
+        # the option string tables belong to the container
+        self._container._actions_changed()
+
+    def _check_not_frozen(self):
+        self._container._check_not_frozen()
+
 
 class ArgumentParser(_AttributeHolder, _ActionsContainer):
 
@@ -1069,11 +1242,14 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
     # ==================================
 
     def add_argument_group(self, *args, **kwargs):
+        self._check_not_frozen()
         group = self.argument_group_class(self, *args, **kwargs)
         self._optionals_groups.append(group)
+        self._actions_changed()
         return group
 
     def add_subparsers(self, **kwargs):
+        self._check_not_frozen()
         if self._has_subparsers:
             self.error(_('cannot have multiple subparser arguments'))
         
@@ -1093,6 +1269,7 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         action = parsers_class(option_strings=[], **kwargs)
         self._positional_actions_list.append(action)
         self._has_subparsers = True
+        self._actions_changed()
 
         # return the created parsers action
         return action
@@ -1112,12 +1289,41 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
                 new_group._add_container_actions(group)
 
     def _get_all_optionals(self):
-        optionals = []
-        optionals.extend(self._optional_actions_list)
-        for optionals_group in self._optionals_groups:
-            optionals.extend(optionals_group._optional_actions_list)
+        # the optionals of the parser followed by those of its groups;
+        # the list is shared by format_usage, format_help, parse_args and
+        # freeze, so callers must not modify it
+        optionals = self._all_optionals
+        if optionals is None:
+            optionals = []
+            optionals.extend(self._optional_actions_list)
+            for optionals_group in self._optionals_groups:
+                optionals.extend(optionals_group._optional_actions_list)
+            self._all_optionals = optionals
         return optionals
 
+    def freeze(self):
+        """freeze()
+
+        Builds everything parse_args derives from the parser's arguments
+        up front, so that it is not rebuilt on the first parse or after
+        a change. No arguments or groups may be added afterwards.
+        """
+        self._get_all_optionals()
+        self._get_default_actions()
+        self._get_long_option_trie()
+
+        # compile the pattern of every action, and the combined patterns
+        # that the positionals are matched with
+        get_nargs_pattern = self._get_nargs_pattern
+        for action in self._get_all_optionals():
+            _compile_nargs_pattern(get_nargs_pattern(action))
+        nargs_patterns = [get_nargs_pattern(action)
+                          for action in self._positional_actions_list]
+        for i in xrange(len(nargs_patterns)):
+            _compile_nargs_pattern(''.join(nargs_patterns[:i + 1]))
+
+        self._frozen = True
+
     def _add_help_argument(self):
         self.add_argument('-h', '--help', action='help',
                           help=_('show this help message and exit'))
@@ -1140,14 +1346,47 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         if namespace is None:
             namespace = Namespace()
             
-        # add any action defaults that aren't present
-        actions = self._get_all_optionals() + self._positional_actions_list
-        for action in actions:
+        # add any action and parser defaults that aren't present; string
+        # defaults are converted on every parse, since conversion may have
+        # side effects (e.g. 'outfile') or produce mutable values
+        if type(namespace) is Namespace:
+            self._add_namespace_dict_defaults(namespace.__dict__)
+        else:
+            self._add_namespace_defaults(namespace)
+            
+        # parse the arguments and exit if there are any errors
+        try:
+            return self._parse_args(args, namespace)
+        except ArgumentError, err:
+            self.error(str(err))
+
+    def _add_namespace_dict_defaults(self, namespace_dict):
+        # a plain Namespace keeps its attributes in its __dict__, so the
+        # defaults can go there directly; str() gives the attribute name
+        # that setattr would use for a unicode dest
+        for action in self._get_default_actions():
+            if action.dest is not SUPPRESS:
+                if action.dest not in namespace_dict:
+                    default = action.default
+                    if default is not SUPPRESS:
+                        if isinstance(default, basestring):
+                            default = self._get_value(action, default)
+                        namespace_dict[str(action.dest)] = default
+
+        # add any parser defaults that aren't present
+        setdefault = namespace_dict.setdefault
+        for dest, value in self._defaults.iteritems():
+            setdefault(dest, value)
+
+    def _add_namespace_defaults(self, namespace):
+        # any other namespace object may define class attributes, slots
+        # or properties, so go through hasattr and setattr
+        for action in self._get_default_actions():
             if action.dest is not SUPPRESS:
                 if not hasattr(namespace, action.dest):
-                    if action.default is not SUPPRESS:
-                        default = action.default
-                        if isinstance(action.default, basestring):
+                    default = action.default
+                    if default is not SUPPRESS:
+                        if isinstance(default, basestring):
                             default = self._get_value(action, default)
                         setattr(namespace, action.dest, default)
 
@@ -1155,45 +1394,55 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         for dest, value in self._defaults.iteritems():
             if not hasattr(namespace, dest):
                 setattr(namespace, dest, value)
-            
-        # parse the arguments and exit if there are any errors
-        try:
-            return self._parse_args(args, namespace)
-        except ArgumentError, err:
-            self.error(str(err))
+
+    def _get_default_actions(self):
+        # the actions whose dest may receive a default
+        actions = self._default_actions
+        if actions is None:
+            actions = self._get_all_optionals() + self._positional_actions_list
+            self._default_actions = actions
+        return actions
 
     def _parse_args(self, arg_strings, namespace):            
 
         # find all option indices, and determine the arg_string_pattern
         # which has an 'O' if there is an option at an index,
-        # an 'A' if there is an argument, or a '-' if there is a '--'
-        option_string_indices = set()
-        arg_string_pattern_parts = []
-        arg_strings_iter = iter(arg_strings)
-        for i, arg_string in enumerate(arg_strings_iter):
-
-            # all args after -- are non-options
-            if arg_string == '--':
-                arg_string_pattern_parts.append('-')
-                for arg_string in arg_strings_iter:
-                    arg_string_pattern_parts.append('A')
-
-            # otherwise, add the arg to the arg strings
-            # and note the index if it was an option
-            else:
-                if arg_string.startswith('-'):
-                    option_string_indices.add(i)
-                    pattern = 'O'
-                else:
-                    pattern = 'A'
-                arg_string_pattern_parts.append(pattern)
+        # an 'A' if there is an argument, or a '-' if there is a '--';
+        # all args after the first -- are non-options
+        try:
+            dash_dash_index = arg_strings.index('--')
+        except ValueError:
+            dash_dash_index = len(arg_strings)
+        options_pattern = ''.join([
+            arg_string[:1] == '-' and 'O' or 'A'
+            for arg_string in arg_strings[:dash_dash_index]
+        ])
+        arg_string_pattern_parts = [options_pattern]
+
+        # note the indices of the options, in increasing order; the regex
+        # engine finds the 'O's faster than a Python loop would
+        option_string_indices = [
+            match.start()
+            for match in _OPTION_MARK_RE.finditer(options_pattern)
+        ]
+
+        # mark the -- and everything after it
+        if dash_dash_index < len(arg_strings):
+            arg_string_pattern_parts.append('-')
+            after_count = len(arg_strings) - dash_dash_index - 1
+            arg_string_pattern_parts.append('A' * after_count)
 
         # join the pieces together to form the pattern
         arg_strings_pattern = ''.join(arg_string_pattern_parts)
 
+        # a '--' can only reach an action if there was one in argv
+        has_dash_dash = dash_dash_index < len(arg_strings)
+
         # converts arg strings to the appropriate and then takes the action
-        def take_action(action, argument_strings, option_string=None):
-            argument_values = self._get_values(action, argument_strings)
+        def take_action(action, argument_strings, option_string=None,
+                        has_dash_dash=has_dash_dash):
+            argument_values = self._get_values(action, argument_strings,
+                                               has_dash_dash)
             action(self, namespace, argument_values, option_string)
 
         # function to convert arg_strings into an optional action
@@ -1215,19 +1464,20 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
                     raise ArgumentError(action, msg)
                 stop = start_index + 1
                 args = [explicit_arg]
+                dash_dash = explicit_arg == '--'
             
             # if there is no explicit argument, try to match the
             # optional's string arguments with the following strings
             else:
                 start = start_index + 1
-                selected_patterns = arg_strings_pattern[start:]
-                arg_count = match_argument(action, selected_patterns)
+                arg_count = match_argument(action, arg_strings_pattern, start)
                 stop = start + arg_count
                 args = arg_strings[start:stop]
+                dash_dash = has_dash_dash
 
             # add the Optional to the list and return the index at which
             # the Optional's string args stopped
-            take_action(action, args, option_string)
+            take_action(action, args, option_string, dash_dash)
             return stop
 
         # the list of Positionals left to be parsed; this is modified
@@ -1238,8 +1488,8 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         def consume_positionals(start_index):
             # match as many Positionals as possible
             match_partial = self._match_arguments_partial
-            selected_pattern = arg_strings_pattern[start_index:]
-            arg_counts = match_partial(positionals, selected_pattern)
+            arg_counts = match_partial(positionals, arg_strings_pattern,
+                                       start_index)
 
             # slice off the appropriate arg strings for each Positional
             # and add the Positional and its args to the list
@@ -1256,34 +1506,27 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         # consume Positionals and Optionals alternately, until we have
         # passed the last option string
         start_index = 0
-        if option_string_indices:
-            max_option_string_index = max(option_string_indices)
-        else:
-            max_option_string_index = -1
-        while start_index <= max_option_string_index:
-            
-            # consume any Positionals preceding the next option
-            next_option_string_index = min(
-                index
-                for index in option_string_indices
-                if index >= start_index)
-            if start_index != next_option_string_index:
+        for option_string_index in option_string_indices:
+
+            # consume any Positionals preceding the option, for as long
+            # as that makes progress
+            while start_index < option_string_index:
                 positionals_end_index = consume_positionals(start_index)
+                if positionals_end_index == start_index:
+                    break
+                start_index = positionals_end_index
 
-                # only try to parse the next optional if we didn't consume
-                # the option string during the positionals parsing
-                if positionals_end_index > start_index:
-                    start_index = positionals_end_index
-                    continue
-                else:
-                    start_index = positionals_end_index
+            # skip option strings that were consumed as the arguments of
+            # an earlier action
+            if start_index > option_string_index:
+                continue
 
             # if we consumed all the positionals we could and we're not
             # at the index of an option string, there were unparseable
             # arguments
-            if start_index not in option_string_indices:
+            if start_index != option_string_index:
                 msg = _('extra arguments found: %s')
-                extras = arg_strings[start_index:next_option_string_index]
+                extras = arg_strings[start_index:option_string_index]
                 self.error(msg % ' '.join(extras))
 
             # consume the next optional and any arguments for it
@@ -1307,10 +1550,12 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         return namespace
 
             
-    def _match_argument(self, action, arg_strings_pattern):
-        # match the pattern for this action to the arg strings
+    def _match_argument(self, action, arg_strings_pattern, start=0):
+        # match the pattern for this action to the arg strings from start
+        # on (matching at an offset avoids copying the rest of the pattern)
         nargs_pattern = self._get_nargs_pattern(action)
-        match = _re.match(nargs_pattern, arg_strings_pattern)
+        match = _compile_nargs_pattern(nargs_pattern).match(
+            arg_strings_pattern, start)
 
         # raise an exception if we weren't able to find a match        
         if match is None:
@@ -1326,18 +1571,23 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         # return the number of arguments matched
         return len(match.group(1))
 
-    def _match_arguments_partial(self, actions, arg_strings_pattern):
+    def _match_arguments_partial(self, actions, arg_strings_pattern,
+                                 start=0):
         # progressively shorten the actions list by slicing off the
-        # final actions until we find a match
+        # final actions until we find a match against the arg strings
+        # from start on; the combined pattern is built once and trimmed
+        # by one action's pattern per step
         result = []
+        nargs_patterns = [self._get_nargs_pattern(action)
+                          for action in actions]
+        pattern = ''.join(nargs_patterns)
         for i in xrange(len(actions), 0, -1):
-            actions_slice = actions[:i]
-            pattern = ''.join(self._get_nargs_pattern(action)
-                              for action in actions_slice)
-            match = _re.match(pattern, arg_strings_pattern)
+            regex = _compile_nargs_pattern(pattern)
+            match = regex.match(arg_strings_pattern, start)
             if match is not None:
-                result.extend(len(string) for string in match.groups())
+                result.extend([len(string) for string in match.groups()])
                 break
+            pattern = pattern[:-len(nargs_patterns[i - 1])]
 
         # return the list of arg string counts
         return result
@@ -1379,11 +1629,10 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         try:
             action = long_opts[option_string]
 
-        # long path: check all words with the argument string as a prefix
+        # long path: find all words with the argument string as a prefix
         except KeyError:
-            possible_option_strings = [
-                word for word in long_opts if word.startswith(option_string)
-            ]
+            possible_option_strings = self._match_long_option_prefix(
+                option_string)
 
             # see if there is exactly one possible string
             try:
@@ -1402,50 +1651,64 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
                 action = long_opts[option_string]
 
         return action
+
+    def _match_long_option_prefix(self, prefix):
+        # descend the trie along the prefix, then collect every option
+        # string stored below that point
+        node = self._get_long_option_trie()
+        for char in prefix:
+            try:
+                node = node[char]
+            except KeyError:
+                return []
+        result = []
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            for char, child in node.iteritems():
+                if char is None:
+                    result.append(child)
+                else:
+                    nodes.append(child)
+        result.sort()
+        return result
+
+    def _get_long_option_trie(self):
+        # a dict per character; the None key of a node holds the option
+        # string ending there
+        trie = self._long_option_trie
+        if trie is None:
+            trie = {}
+            for option_string in self._long_option_strings:
+                node = trie
+                for char in option_string:
+                    node = node.setdefault(char, {})
+                node[None] = option_string
+            self._long_option_trie = trie
+        return trie
                 
     def _get_nargs_pattern(self, action):
-        # in all examples below, we have to allow for '--' args
-        # which are represented as '-' in the pattern
         nargs = action.nargs
-        
-        # the default (None) is assumed to be a single argument
-        if nargs is None:
-            nargs_pattern = '(-*A-*)'
-
-        # allow zero or one arguments
-        elif nargs == OPTIONAL:
-            nargs_pattern = '(-*A?-*)'
-
-        # allow zero or more arguments
-        elif nargs == ZERO_OR_MORE:
-            nargs_pattern = '(-*[A-]*)'
-
-        # allow one or more arguments
-        elif nargs == ONE_OR_MORE:
-            nargs_pattern = '(-*A[A-]*)'
-
-        # allow one argument followed by any number of options or arguments
-        elif nargs is PARSER:
-            nargs_pattern = '(-*A[-AO]*)'
+        try:
+            return _NARGS_PATTERNS[nargs]
 
-        # all others should be integers            
-        else:
+        # all others should be integers
+        except KeyError:
             nargs_pattern = '(-*%s-*)' % '-*'.join('A' * nargs)
-        
-        # return the pattern
-        return nargs_pattern
+            _NARGS_PATTERNS[nargs] = nargs_pattern
+            return nargs_pattern
 
     # ========================
     # Value conversion methods
     # ========================
 
-    def _get_values(self, action, arg_strings):
+    def _get_values(self, action, arg_strings, has_dash_dash=True):
         # for everything but PARSER args, strip out '--'
-        if action.nargs is not PARSER:
+        if has_dash_dash and action.nargs is not PARSER:
             arg_strings = [s for s in arg_strings if s != '--']
         
         # optional argument produces a default when not present
-        if not arg_strings and action.nargs == OPTIONAL:
+        if not arg_strings and action.nargs is OPTIONAL:
             if action.option_strings:
                 value = action.const
             else:
@@ -1455,7 +1718,8 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
                 self._check_value(action, value)
         
         # single argument or optional argument produces a single value
-        elif len(arg_strings) == 1 and action.nargs in [None, OPTIONAL]:
+        elif len(arg_strings) == 1 and (action.nargs is None or
+                                        action.nargs is OPTIONAL):
             arg_string, = arg_strings
             value = self._get_value(action, arg_string)
             self._check_value(action, value)
@@ -1474,12 +1738,22 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         # return the converted value            
         return value
 
+    def _get_type_func(self, action):
+        # look up the action's type function once per parser; register()
+        # clears this cache
+        try:
+            return self._type_funcs[action]
+        except KeyError:
+            type_func = self._registry_get('type', action.type, action.type)
+            if not callable(type_func):
+                msg = _('%r is not callable')
+                raise ArgumentError(action, msg % type_func)
+            self._type_funcs[action] = type_func
+            return type_func
+
     def _get_value(self, action, arg_string):
-        type_func = self._registry_get('type', action.type, action.type)
-        if not callable(type_func):
-            msg = _('%r is not callable')
-            raise ArgumentError(action, msg % type_func)
-        
+        type_func = self._get_type_func(action)
+
         # convert the value to the appropriate type
         try:
             result = type_func(arg_string)
@@ -1514,6 +1788,14 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         return formatter.format_help()
 
     def format_help(self):
+        # with no arguments, groups, description or epilog, the help is
+        # just the usage
+        if (self.description is None and self.epilog is None and
+            not self._positional_actions_list and
+            not self._optional_actions_list and
+            not self._optionals_groups):
+            return self.format_usage()
+
         formatter = self._get_formatter()
 
         # usage
@@ -1532,11 +1814,20 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         # optionals
         formatter.start_section(_('optional arguments'))
         formatter.add_arguments(self._optional_actions_list)
+        start_section = formatter.start_section
+        end_section = formatter.end_section
+        add_text = formatter.add_text
+        add_arguments = formatter.add_arguments
         for optionals_group in self._optionals_groups:
-            formatter.start_section(optionals_group.title)
-            formatter.add_text(optionals_group.description)
-            formatter.add_arguments(optionals_group._optional_actions_list)
-            formatter.end_section()
+            # a group with neither arguments nor description shows nothing
+            group_actions = optionals_group._optional_actions_list
+            description = optionals_group.description
+            if not group_actions and not description:
+                continue
+            start_section(optionals_group.title)
+            add_text(description)
+            add_arguments(group_actions)
+            end_section()
         formatter.end_section()
 
         # epilog
@@ -1591,5 +1882,6 @@ class ArgumentParser(_AttributeHolder, _ActionsContainer):
         If you override this in a subclass, it should not return -- it
         should either exit or raise an exception.
         """
-        self.print_usage(_sys.stderr)
-        self.exit(2, _('%s: error: %s\n') % (self.prog, message))
+        # write the usage and the error together, in a single write
+        usage = self.format_usage()
+        self.exit(2, usage + _('%s: error: %s\n') % (self.prog, message))
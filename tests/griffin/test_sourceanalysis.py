@@ -1,8 +1,10 @@
 from __future__ import generators
 
 import unittest
+import sys
 import re
 
+import java.util
 import sourceanalysis
 
 # stubs for abstract classes
@@ -10,6 +12,8 @@ class TemplateParameterStub(sourceanalysis.TemplateParameter): pass
 class EntityStub(sourceanalysis.Entity): pass
 class HintStub(sourceanalysis.Hint): pass
 
+_TOSTRING_RE = re.compile(r"EntityStub.*\(booga\)")
+
 # stubs for exposing protected methods
 class ScopeStub(sourceanalysis.Scope):
     def mirrorRelationToMember(self, *args):
@@ -104,6 +108,18 @@ class EntityTests(unittest.TestCase):
             get_iterator = self.entity.affiliatesIterator,
         )
 
+    def test_setAffiliates(self):
+        affiliates = [
+            sourceanalysis.FriendConnection(EntityStub(), EntityStub())
+            for i in xrange(5)
+        ]
+        self.entity.setAffiliates(_create_vector(affiliates))
+
+        actual_affiliates = list(self.entity.affiliatesIterator())
+        assert len(actual_affiliates) == len(affiliates)
+        for index in xrange(len(affiliates)):
+            assert actual_affiliates[index] is affiliates[index]
+
     def test_isTemplated(self):
         assert not self.entity.isTemplated()
         self.entity.addTemplateParameter(TemplateParameterStub())
@@ -111,7 +127,7 @@ class EntityTests(unittest.TestCase):
 
     def test_toString(self):
         self.entity.setName("booga")
-        assert re.search("EntityStub.*\(booga\)", self.entity.toString())
+        assert _TOSTRING_RE.search(self.entity.toString())
 
     def test_lookForHint(self):
         assert self.entity.lookForHint(HintStub) is None
@@ -333,10 +349,10 @@ class IncompleteTemplateInstanceTests(unittest.TestCase):
             )
 
 def _create_vector(seq):
-    import java.util
-    result = java.util.Vector()
+    result = java.util.Vector(len(seq))
+    add = result.add
     for item in seq:
-        result.add(item)
+        add(item)
     return result
 
 def _verify_collection_accessors(
@@ -368,9 +384,9 @@ def _verify_collection_accessors(
     actual_items = list(get_iterator())
 
     assert len(actual_items) == len(items)
-    for expected_item, actual_item in zip(items, actual_items):
-        value = extract_value(actual_item)
-        assert expected_item is value
+    for index in xrange(len(items)):
+        value = extract_value(actual_items[index])
+        assert items[index] is value
 
 def _verify_type(self, instance):
     """
@@ -385,16 +401,8 @@ def _verify_type(self, instance):
     instance.setType( type )
     assert instance.getType() is type
 
-def _all_test_cases():
-    from types import ClassType
-    for object in globals().values():
-        if type(object) == ClassType and issubclass(object, unittest.TestCase):
-            yield object
-
 def suite():
-    result = unittest.TestSuite()
-    for test_case in _all_test_cases():
-        result.addTest(unittest.makeSuite(test_case))
-    return result
+    module = sys.modules[__name__]
+    return unittest.defaultTestLoader.loadTestsFromModule(module)
 
 if __name__ == "__main__": unittest.main()
@@ -0,0 +1,3 @@
+import test_argparse
+def suite():
+    return test_argparse.suite()
@@ -0,0 +1,266 @@
+import unittest
+import sys
+import os
+
+try:
+    __file__
+except NameError:
+    __file__ = sys.argv[0]
+
+# robinlib's argparse, not the standard library's
+sys.path.insert(0, os.path.normpath(os.path.join(
+    os.path.dirname(__file__), "..", "..", "src", "robin", "modules",
+    "robinlib")))
+
+import argparse
+
+class ArgumentParserError(Exception): pass
+
+class ErrorRaisingArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise ArgumentParserError(message)
+
+def _parse(parser, args):
+    return sorted(vars(parser.parse_args(args)).items())
+
+def _error(parser, args):
+    try:
+        parser.parse_args(args)
+    except ArgumentParserError, error:
+        return str(error)
+    raise AssertionError("%r parsed without an error" % (args,))
+
+def _create_parser():
+    parser = ErrorRaisingArgumentParser(prog="PROG")
+    parser.add_argument("--foo")
+    parser.add_argument("--foobar", action="store_true")
+    parser.add_argument("--bar", nargs="?", const="c")
+    parser.add_argument("--baz", nargs=2)
+    parser.add_argument("-x", action="count")
+    group = parser.add_argument_group("group")
+    group.add_argument("--qux", type=int)
+    parser.add_argument("first")
+    parser.add_argument("rest", nargs="*")
+    return parser
+
+class ParseTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = _create_parser()
+
+    def tearDown(self):
+        del self.parser
+
+    def test_defaults(self):
+        assert _parse(self.parser, ["a"]) == [
+            ("bar", None), ("baz", None), ("first", "a"), ("foo", None),
+            ("foobar", False), ("qux", None), ("rest", []), ("x", None),
+        ]
+
+    def test_interleaved(self):
+        result = dict(_parse(self.parser,
+                             ["-x", "a", "b", "--foo", "f", "-x", "-x"]))
+        assert result["x"] == 3
+        assert result["foo"] == "f"
+        assert result["first"] == "a"
+        assert result["rest"] == ["b"]
+
+    def test_optional_argument_stops_at_option(self):
+        result = dict(_parse(self.parser, ["--bar", "--foo", "f", "a"]))
+        assert result["bar"] == "c"
+        assert result["foo"] == "f"
+
+    def test_group_argument(self):
+        assert dict(_parse(self.parser, ["--qux", "3", "a"]))["qux"] == 3
+
+    def test_dash_dash(self):
+        result = dict(_parse(self.parser, ["a", "--", "--foo", "-x"]))
+        assert result["rest"] == ["--foo", "-x"]
+        assert result["foo"] is None
+
+    def test_explicit_argument(self):
+        assert dict(_parse(self.parser, ["--foo=f", "a"]))["foo"] == "f"
+
+    def test_too_few_arguments(self):
+        assert _error(self.parser, ["--baz", "1"]) == \
+            "argument --baz: expected 2 argument(s)"
+        assert _error(self.parser, []) == "too few arguments"
+
+    def test_extra_arguments(self):
+        parser = ErrorRaisingArgumentParser(prog="PROG")
+        parser.add_argument("first")
+        parser.add_argument("-y")
+        assert _error(parser, ["a", "b", "-y", "1"]) == \
+            "extra arguments found: b"
+        assert _error(parser, ["a", "-y", "1", "b"]) == \
+            "extra arguments found: b"
+
+class LongOptionPrefixTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = _create_parser()
+
+    def tearDown(self):
+        del self.parser
+
+    def test_unique_prefix(self):
+        assert dict(_parse(self.parser, ["--q", "1", "a"]))["qux"] == 1
+        assert dict(_parse(self.parser, ["--foob", "a"]))["foobar"] is True
+
+    def test_exact_match_beats_longer_option(self):
+        result = dict(_parse(self.parser, ["--foo", "f", "a"]))
+        assert result["foo"] == "f"
+        assert result["foobar"] is False
+
+    def test_ambiguous_prefix(self):
+        assert _error(self.parser, ["--ba", "a"]) == \
+            "ambiguous option: --ba (--bar, --baz?)"
+        assert _error(self.parser, ["--f", "a"]) == \
+            "ambiguous option: --f (--foo, --foobar?)"
+
+    def test_no_such_option(self):
+        assert _error(self.parser, ["--nope", "a"]) == \
+            "no such option: --nope"
+
+    def test_prefix_sees_later_arguments(self):
+        self.parser.parse_args(["--qu", "1", "a"])
+        self.parser.add_argument("--quux")
+        assert _error(self.parser, ["--qu", "1", "a"]) == \
+            "ambiguous option: --qu (--quux, --qux?)"
+
+class FreezeTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = _create_parser()
+
+    def tearDown(self):
+        del self.parser
+
+    def test_same_results_after_freeze(self):
+        argvs = [
+            ["a"],
+            ["-x", "a", "b", "--foo", "f", "-x", "-x"],
+            ["--baz", "1", "2", "a", "--", "-x"],
+            ["--q", "4", "a", "b"],
+        ]
+        expected = [_parse(self.parser, argv) for argv in argvs]
+        self.parser.freeze()
+        assert [_parse(self.parser, argv) for argv in argvs] == expected
+
+    def test_errors_after_freeze(self):
+        self.parser.freeze()
+        assert _error(self.parser, ["--ba", "a"]) == \
+            "ambiguous option: --ba (--bar, --baz?)"
+        assert _error(self.parser, []) == "too few arguments"
+
+    def test_add_argument_rejected(self):
+        self.parser.freeze()
+        self.assertRaises(ValueError, self.parser.add_argument, "--new")
+
+    def test_group_add_argument_rejected(self):
+        group = self.parser.add_argument_group("late")
+        self.parser.freeze()
+        self.assertRaises(ValueError, group.add_argument, "--new")
+
+    def test_add_argument_group_rejected(self):
+        self.parser.freeze()
+        self.assertRaises(ValueError, self.parser.add_argument_group, "new")
+
+    def test_add_subparsers_rejected(self):
+        self.parser.freeze()
+        self.assertRaises(ValueError, self.parser.add_subparsers)
+
+    def test_frozen_parser_unchanged_by_rejection(self):
+        self.parser.freeze()
+        self.assertRaises(ValueError, self.parser.add_argument, "--new")
+        assert _error(self.parser, ["--new", "1", "a"]) == \
+            "no such option: --new"
+
+def _help_formatter(prog):
+    # the default width for an 80 column terminal, whatever $COLUMNS is
+    return argparse.HelpFormatter(prog, width=78)
+
+class HelpTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = ErrorRaisingArgumentParser(
+            prog="PROG", description="A test program.",
+            formatter_class=_help_formatter)
+        self.parser.add_argument("--foo", help="foo help")
+        self.parser.add_argument("--bar", default="b",
+                                 help="bar defaults to %(default)s")
+        self.parser.add_argument("--choice", choices=["a", "b", "c"],
+                                 help="one of %(choices)s")
+        self.parser.add_argument("--secret", help=argparse.SUPPRESS)
+        self.parser.add_argument("--a-very-long-option-name",
+                                 metavar="VALUE",
+                                 help="long invocation help")
+        self.parser.add_argument("--multi", help="help that is long enough "
+                                 "to need more than one line when it is "
+                                 "wrapped at the default width of the help")
+        self.parser.add_argument_group("empty")
+        group = self.parser.add_argument_group("grouped",
+                                               "group description")
+        group.add_argument("--qux", type=int, help="qux help")
+        self.parser.add_argument("first", help="first help")
+        self.parser.add_argument("rest", nargs="*")
+
+    def tearDown(self):
+        del self.parser
+
+    usage = """\
+usage: PROG [-h] [--foo FOO] [--bar BAR] [--choice {a,b,c}] [--a-very-long-
+            option-name VALUE] [--multi MULTI] [--qux QUX]
+            first [rest [rest ...]]
+"""
+
+    def test_format_usage(self):
+        assert self.parser.format_usage() == self.usage
+
+    def test_format_help(self):
+        assert self.parser.format_help() == self.usage + """
+A test program.
+
+positional arguments:
+  first                 first help
+  rest
+
+optional arguments:
+  -h, --help            show this help message and exit
+  --foo FOO             foo help
+  --bar BAR             bar defaults to b
+  --choice {a,b,c}      one of a, b, c
+  --a-very-long-option-name VALUE
+                        long invocation help
+  --multi MULTI         help that is long enough to need more than one line
+                        when it is wrapped at the default width of the help
+
+  grouped:
+    group description
+
+    --qux QUX           qux help
+"""
+
+    def test_same_help_twice(self):
+        expected = self.parser.format_help()
+        assert self.parser.format_help() == expected
+        assert self.parser.format_usage() == self.usage
+
+    def test_wrapped_usage(self):
+        parser = ErrorRaisingArgumentParser(prog="PROG",
+                                            formatter_class=_help_formatter)
+        for name in ["alpha", "bravo", "charlie", "delta", "echo",
+                     "foxtrot", "golf"]:
+            parser.add_argument("--" + name)
+        assert parser.format_usage() == """\
+usage: PROG [-h] [--alpha ALPHA] [--bravo BRAVO] [--charlie CHARLIE] [--delta
+            DELTA] [--echo ECHO] [--foxtrot FOXTROT] [--golf GOLF]
+"""
+
+    def test_bare_parser(self):
+        parser = ErrorRaisingArgumentParser(prog="PROG", add_help=False,
+                                            formatter_class=_help_formatter)
+        assert parser.format_usage() == "usage: PROG\n"
+        assert parser.format_help() == "usage: PROG\n"
+
+def suite():
+    module = sys.modules[__name__]
+    return unittest.defaultTestLoader.loadTestsFromModule(module)
+
+if __name__ == "__main__": unittest.main()